@@ -1,28 +1,379 @@
-import ads
+import html
+import json
+import logging
+import re
+import unicodedata
 
+logger = logging.getLogger("adsapi")
 
-def export_citation(bibcodes, output_format="aastex"):
-    """Export the bibcodes in the form of aastex 
+FIELDS = [
+    "bibcode",
+    "alternate_bibcode",
+    "identifier",
+    "author",
+    "title",
+    "year",
+    "bibstem",
+    "pub",
+    "doctype",
+    "volume",
+    "page",
+    "doi",
+]
+CHUNK_SIZE = 100
+
+ACCENTS = {
+    "\u0300": "`",
+    "\u0301": "'",
+    "\u0302": "^",
+    "\u0303": "~",
+    "\u0304": "=",
+    "\u0306": "u",
+    "\u0307": ".",
+    "\u0308": '"',
+    "\u030a": "r",
+    "\u030b": "H",
+    "\u030c": "v",
+    "\u0327": "c",
+    "\u0328": "k",
+}
+SPECIAL_LETTERS = {
+    "\u00df": "{\\ss}",
+    "\u00e6": "{\\ae}",
+    "\u00c6": "{\\AE}",
+    "\u00f8": "{\\o}",
+    "\u00d8": "{\\O}",
+    "\u0131": "{\\i}",
+    "\u0142": "{\\l}",
+    "\u0141": "{\\L}",
+    "\u0153": "{\\oe}",
+    "\u0152": "{\\OE}",
+}
+BIBTEX_TYPES = {
+    "article": "ARTICLE",
+    "eprint": "ARTICLE",
+    "inproceedings": "INPROCEEDINGS",
+    "abstract": "INPROCEEDINGS",
+    "inbook": "INBOOK",
+    "book": "BOOK",
+    "proceedings": "PROCEEDINGS",
+    "phdthesis": "PHDTHESIS",
+    "mastersthesis": "MASTERSTHESIS",
+    "techreport": "TECHREPORT",
+}
+
+_records = dict()
+_unmapped_journals = set()
+
+
+def fetch_records(bibcodes):
+    """Fetch the structured records of the bibcodes from ADS
+
+    Each bibcode is fetched at most once, the records are kept in a local
+    cache so that rendering them in other formats costs no extra query. The
+    cache can be kept across runs with load_records and save_records.
+
+    A record is stored under the requested bibcode ("key"). ADS may answer
+    with another bibcode ("bibcode"), e.g. the published version of an arXiv
+    preprint, in which case a warning is logged.
 
     Args:
         bibcodes (list): string list of bibcodes
-        output_format (str): output format
-                             ("aastex")
 
     Returns:
-        bibs (list): string list of bibs
+        records (list): list of records found in ADS
+
+    Raises:
+        Exception: the ADS query failed
     """
-    if len(bibcodes) == 0:
-        return []
-    else:
-        q = ads.ExportQuery(bibcodes, format=output_format)
-        try:
-            export_response = q.execute()
-        except:
-            print("{0} is not in ADS library!".format(bibcodes))
+    missing = [bibcode for bibcode in bibcodes if bibcode not in _records]
+    if len(missing) > 0:
+        import ads
+
+        for i in range(0, len(missing), CHUNK_SIZE):
+            chunk = missing[i : i + CHUNK_SIZE]
+            # identifier covers the alternate bibcodes, e.g. arXiv preprints
+            # which have been published since
+            q = ads.SearchQuery(
+                q=" OR ".join(
+                    'identifier:"{0}"'.format(bibcode) for bibcode in chunk
+                ),
+                fl=FIELDS,
+                rows=len(chunk),
+            )
+            for article in q:
+                record = _to_record(article)
+                aliases = set(
+                    [record["bibcode"]]
+                    + list(article.alternate_bibcode or [])
+                    + list(article.identifier or [])
+                )
+                for bibcode in chunk:
+                    if bibcode in aliases:
+                        _records[bibcode] = dict(record, key=bibcode)
+                        if bibcode != record["bibcode"]:
+                            logger.warning(
+                                "{0} is replaced by {1} in the ADS!".format(
+                                    bibcode, record["bibcode"]
+                                )
+                            )
+    return [_records[bibcode] for bibcode in bibcodes if bibcode in _records]
+
+
+def load_records(filename):
+    """Load the cached records from a json file
+
+    Args:
+        filename (str | Path): json file written by save_records
+    """
+    try:
+        with open(filename) as f:
+            records = json.load(f)
+    except FileNotFoundError:
+        return
+    except ValueError:
+        logger.warning("{0} is not a valid record cache!".format(filename))
+        return
+    _records.update(records)
+
+
+def save_records(filename):
+    """Save the cached records to a json file
+
+    Args:
+        filename (str | Path): json file
+    """
+    if len(_records) == 0:
+        return
+    with open(filename, "w") as f:
+        json.dump(_records, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+
+
+def _to_record(article):
+    # Every field in FIELDS is set on the article (None if absent from the
+    # response), so no lazy per-article query is triggered here
+    eprints = [
+        identifier[len("arXiv:") :]
+        for identifier in article.identifier or []
+        if identifier.startswith("arXiv:")
+    ]
+    return {
+        "key": article.bibcode,
+        "bibcode": article.bibcode,
+        "authors": list(article.author or []),
+        "title": (article.title or [""])[0],
+        "year": article.year or article.bibcode[:4],
+        "journal": (article.bibstem or [""])[0],
+        "pub": article.pub or "",
+        "doctype": article.doctype or "",
+        "volume": article.volume or "",
+        "page": (article.page or [""])[0],
+        "doi": (article.doi or [""])[0],
+        "eprint": (eprints or [""])[0],
+    }
+
+
+def to_latex(text):
+    """Convert the ADS text to LaTeX
+
+    HTML markup and entities are converted, special characters are escaped
+    and accented letters are written as LaTeX accents, e.g. "Müller" ->
+    "M{\\"u}ller"
+
+    Args:
+        text (str): ADS text
+
+    Returns:
+        text (str): LaTeX text
+    """
+    text = re.sub(r"<SUB>(.*?)</SUB>", r"$_{\1}$", text, flags=re.IGNORECASE)
+    text = re.sub(r"<SUP>(.*?)</SUP>", r"$^{\1}$", text, flags=re.IGNORECASE)
+    text = re.sub(r"</?[A-Za-z]+>", "", text)
+    text = html.unescape(text)
+    text = re.sub(r"(?<!\\)([&%#])", r"\\\1", text)
+    chars = list()
+    for char in unicodedata.normalize("NFD", text):
+        if char in ACCENTS and len(chars) > 0:
+            base = chars.pop()
+            accent = ACCENTS[char]
+            if accent.isalpha():
+                chars.append("{{\\{0}{{{1}}}}}".format(accent, base))
+            else:
+                chars.append("{{\\{0}{1}}}".format(accent, base))
         else:
-            bibs = list()
-            for bib in export_response.split("\n"):
-                if len(bib) > 0:
-                    bibs.append(bib)
-            return bibs
+            chars.append(SPECIAL_LETTERS.get(char, char))
+    return "".join(chars)
+
+
+def split_name(author):
+    """Split the ADS author name into last name and initials
+
+    "Smith, John A." -> ("Smith", "J.~A."), both converted to LaTeX
+
+    Args:
+        author (str): author name
+
+    Returns:
+        name (tuple): last name and initials
+    """
+    last, _, first = author.partition(",")
+    initials = list()
+    for token in first.split():
+        parts = [part for part in token.split("-") if part]
+        initials.append("-".join(to_latex(part[0]) + "." for part in parts))
+    return to_latex(last.strip()), "~".join(initials)
+
+
+def format_cite(record):
+    """Format the cite of the record
+
+    Args:
+        record (dict): ADS record
+
+    Returns:
+        cite (str): cite, e.g. "Smith et al.(2019)"
+    """
+    lasts = [split_name(author)[0] for author in record["authors"]]
+    if len(lasts) == 0:
+        return "Anonymous({0})".format(record["year"])
+    elif len(lasts) == 1:
+        return "{0}({1})".format(lasts[0], record["year"])
+    elif len(lasts) == 2:
+        return "{0} \\& {1}({2})".format(lasts[0], lasts[1], record["year"])
+    else:
+        return "{0} et al.({1})".format(lasts[0], record["year"])
+
+
+def format_journal(record, journals=None):
+    """Format the journal of the record
+
+    Journals not found in journals fall back to the full publication name,
+    with a warning logged once per journal
+
+    Args:
+        record (dict): ADS record
+        journals (dict): ADS bibstem to journal, e.g. "ApJ" -> "\\apj"
+
+    Returns:
+        journal (str): journal, e.g. "\\apj"
+    """
+    journal = record["journal"].replace("&", "\\&")
+    if journals is None:
+        return journal
+    if journal in journals:
+        return journals[journal]
+    if record["doctype"] != "eprint" and journal not in _unmapped_journals:
+        _unmapped_journals.add(journal)
+        logger.warning("{0} is not found in the AAS journal TeX!".format(journal))
+    return to_latex(record["pub"]) if record["pub"] else journal
+
+
+def format_bib(record, journals=None):
+    """Format the bib of the record in aastex
+
+    Args:
+        record (dict): ADS record
+        journals (dict): ADS bibstem to journal
+
+    Returns:
+        bib (str): bib, e.g. "Smith, J., \\& Jones, A.\\ 2019, \\apj, 880, 1"
+    """
+    names = list()
+    for author in record["authors"]:
+        last, initials = split_name(author)
+        names.append("{0}, {1}".format(last, initials) if initials else last)
+    if len(names) <= 1:
+        authors = "".join(names)
+    elif len(names) <= 3:
+        authors = ", ".join(names[:-1]) + ", \\& " + names[-1]
+    else:
+        authors = ", ".join(names[:3]) + ", et al."
+    fields = [format_journal(record, journals), record["volume"], record["page"]]
+    bib = ", ".join(
+        ["{0}\\ {1}".format(authors, record["year"])] + [f for f in fields if f]
+    )
+    if record["doi"]:
+        bib += ". doi:{0}".format(record["doi"])
+    return bib
+
+
+def render_aastex(record, journals=None):
+    """Render the record as aastex bibitem
+
+    Args:
+        record (dict): ADS record
+        journals (dict): ADS bibstem to journal
+
+    Returns:
+        bibitem (str): "\\bibitem[cite]{key} bib"
+    """
+    return "\\bibitem[{0}]{{{1}}} {2}".format(
+        format_cite(record), record["key"], format_bib(record, journals)
+    )
+
+
+def render_bibtex(record, journals=None):
+    """Render the record as bibtex entry
+
+    The entry type follows the ADS doctype, e.g. "eprint" -> "@ARTICLE",
+    "inproceedings" -> "@INPROCEEDINGS", others -> "@MISC"
+
+    Args:
+        record (dict): ADS record
+        journals (dict): ADS bibstem to journal
+
+    Returns:
+        entry (str): bibtex entry
+    """
+    entry_type = BIBTEX_TYPES.get(record["doctype"], "MISC")
+    authors = list()
+    for author in record["authors"]:
+        last, initials = split_name(author)
+        authors.append("{{{0}}}, {1}".format(last, initials) if initials else last)
+    container = ""
+    if entry_type == "ARTICLE":
+        container = "journal"
+    elif entry_type in ["INPROCEEDINGS", "INBOOK"]:
+        container = "booktitle"
+    elif entry_type == "MISC":
+        container = "howpublished"
+    fields = [
+        ("author", "{{{0}}}".format(" and ".join(authors)) if authors else ""),
+        (
+            "title",
+            '"{{{0}}}"'.format(to_latex(record["title"])) if record["title"] else "",
+        ),
+    ]
+    if container == "journal" and record["journal"]:
+        fields.append(
+            ("journal", "{{{0}}}".format(format_journal(record, journals)))
+        )
+    elif container and record["pub"]:
+        fields.append((container, "{{{0}}}".format(to_latex(record["pub"]))))
+    fields += [
+        ("year", record["year"]),
+        ("volume", "{{{0}}}".format(record["volume"]) if record["volume"] else ""),
+        ("pages", "{{{0}}}".format(record["page"]) if record["page"] else ""),
+        ("doi", "{{{0}}}".format(record["doi"]) if record["doi"] else ""),
+        ("eprint", "{{{0}}}".format(record["eprint"]) if record["eprint"] else ""),
+        ("archivePrefix", "{arXiv}" if record["eprint"] else ""),
+    ]
+    lines = ["@{0}{{{1},".format(entry_type, record["key"])]
+    for name, value in fields:
+        if value:
+            lines.append("{0:>13} = {1},".format(name, value))
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def render_json(records):
+    """Render the records as json
+
+    Args:
+        records (list): list of ADS records
+
+    Returns:
+        json (str): json string
+    """
+    return json.dumps(records, indent=2, ensure_ascii=False)
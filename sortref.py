@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import argparse
 import glob
 import logging
@@ -6,11 +8,13 @@ import re
 import sys
 from collections import Counter
 from pathlib import Path
-
-import pandas as pd
+from typing import TYPE_CHECKING
 
 import adsapi
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 logging.basicConfig(
     level=logging.INFO,
     format="[%(levelname)s] %(name)s: %(message)s",
@@ -18,6 +22,25 @@ logging.basicConfig(
 )
 logger = logging.getLogger("sortref")
 
+# ADS records are kept next to the main tex file across runs
+RECORDS_FILE = ".ads_records.json"
+
+# ADS bibstems that differ from the shortname in aas_journal.cls
+BIBSTEM_MACROS = {
+    "Natur": "\\nat",
+    "A\\&ARv": "\\aapr",
+    "ApL": "\\aplett",
+    "GeCoA": "\\gca",
+    "GeoRL": "\\grl",
+    "JGR": "\\jgr",
+    "P\\&SS": "\\planss",
+    "SPIE": "\\procspie",
+    "ChJAA": "\\cjaa",
+    "SvA": "\\sovast",
+    "AAS": "\\aas",
+    "DPS": "\\dps",
+}
+
 
 def read_bib(filename: Path) -> pd.DataFrame:
     r"""Read bib from the tex file.
@@ -32,6 +55,8 @@ def read_bib(filename: Path) -> pd.DataFrame:
     Returns:
         df (pd.DataFrame): bib data
     """
+    import pandas as pd
+
     bib_items = list()
     with open(filename) as f:
         bib_tag = False
@@ -53,7 +78,6 @@ def read_bib(filename: Path) -> pd.DataFrame:
             if "\\begin{thebibliography}" in line:
                 bib_tag = True
     info_list = list()
-    pd.options.mode.chained_assignment = None  # type: ignore
     if len(bib_items) > 0:
         for bib_item in bib_items:
             info_list.append(extract_info(bib_item))
@@ -163,6 +187,38 @@ def extract_info(bib_item: str) -> dict:
     return info
 
 
+def record_to_info(record: dict, journals: dict) -> dict:
+    """Convert ADS record to info.
+
+    Same fields as extract_info, but the authors are taken from the record
+    instead of being parsed from the bib string
+
+    Args:
+        record (dict): ADS record
+        journals (dict): ADS bibstem to journal
+
+    Returns:
+        info (dict): info dictionary
+    """
+    info = dict()
+    info["cite"] = adsapi.format_cite(record)
+    info["key"] = record["key"]
+    info["bib"] = adsapi.format_bib(record, journals)
+    # The year of the record, as in cite and bib, which differs from the key
+    # when ADS replaces the bibcode, e.g. arXiv 2019 -> published 2020
+    info["year"] = str(record["year"])
+    authors = [adsapi.split_name(author) for author in record["authors"][:3]]
+    authors += [("", "")] * (3 - len(authors))
+    for i, (last, initials) in enumerate(authors, 1):
+        info["au{0}_f".format(i)] = last
+        info["au{0}_l".format(i)] = initials.split(".")[0]
+    info["num"] = min(len(record["authors"]), 4)
+    for i in range(1, 4):
+        info["au{0}_f_low".format(i)] = info["au{0}_f".format(i)].lower()
+        info["au{0}_l_low".format(i)] = info["au{0}_l".format(i)].lower()
+    return info
+
+
 def read_content_dict(content_dict: dict, filename):
     """Read content dict from filename.
 
@@ -221,8 +277,7 @@ def change_dup_cite(df: pd.DataFrame) -> None:
     """
     cite_dups = Counter(df.loc[df.duplicated("cite")]["cite"].values).keys()
     for cite in cite_dups:
-        df_dup = df.loc[df["cite"] == cite]
-        df_dup.sort_values(
+        df_dup = df.loc[df["cite"] == cite].sort_values(
             [
                 "au1_f_low",
                 "au1_l_low",
@@ -232,8 +287,7 @@ def change_dup_cite(df: pd.DataFrame) -> None:
                 "au3_l_low",
                 "num",
                 "year",
-            ],
-            inplace=True,
+            ]
         )
         logger.info(
             "{0} duplicate cites {1} are found: {2}".format(
@@ -321,12 +375,14 @@ def remove_useless(df: pd.DataFrame, line_list: list) -> None:
     df.reset_index(inplace=True, drop=True)
 
 
-def find_missing(df: pd.DataFrame, line_list: list[str]) -> None:
-    """Find missing keys in the content.
+def find_cited_keys(line_list: list[str]) -> list[str]:
+    """Find cited keys in the content.
 
     Args:
-        df (pd.DataFrame): bib data
         line_list (list): line list
+
+    Returns:
+        keys (list[str]): cited keys in the order of appearance
     """
     content_join = "".join([line.strip() for line in line_list])
     keys = list()
@@ -341,25 +397,34 @@ def find_missing(df: pd.DataFrame, line_list: list[str]) -> None:
             key = item.strip()
             if is_key(key) and key not in keys:
                 keys.append(key)
+    return keys
+
+
+def find_missing(df: pd.DataFrame, line_list: list[str]) -> None:
+    """Find missing keys in the content.
+
+    Args:
+        df (pd.DataFrame): bib data
+        line_list (list): line list
+    """
+    keys = find_cited_keys(line_list)
     missing_key = list()
     for key in keys:
         if key.strip() not in df.key.values:
             logger.info("{0} is not found in the bib!".format(key.strip()))
             missing_key.append(key.strip())
-    missing_bibs = adsapi.export_citation(missing_key)
-    if missing_bibs is not None:
-        if len(missing_bibs) < len(missing_key):
-            missing_key_found = list()
-            for bib_item in missing_bibs:
-                info = extract_info(bib_item)
-                df.loc[len(df)] = info  # type: ignore
-                missing_key_found.append(info["key"])
-            missing_key_not_found = list(set(missing_key) - set(missing_key_found))
-            for key in missing_key_not_found:
-                logger.warning("{0} is not found in the ADS!".format(key))
-        else:
-            for bib_item in missing_bibs:
-                df.loc[len(df)] = extract_info(bib_item)  # type: ignore
+    try:
+        records = adsapi.fetch_records(missing_key)
+    except Exception as e:
+        logger.error("ADS query failed: {0}".format(e))
+        return
+    if len(records) > 0:
+        journals = read_journal_dict()
+        for record in records:
+            df.loc[len(df)] = record_to_info(record, journals)  # type: ignore
+    missing_key_not_found = set(missing_key) - set(record["key"] for record in records)
+    for key in missing_key_not_found:
+        logger.warning("{0} is not found in the ADS!".format(key))
 
 
 def is_key(key: str) -> bool:
@@ -431,13 +496,15 @@ def change_two_author_cite(df: pd.DataFrame) -> None:
     Args:
         df (pd.DataFrame): bib data
     """
-    df_sel = df[df.num == 2]
-    df_sel["cite"] = df_sel.apply(_format_citation, axis=1)
-    df.loc[df_sel.index, "cite"] = df_sel["cite"]
-
-
-def _format_citation(row):
-    return "{0} \\& {1}({2})".format(row["au1_f"], row["au2_f"], row["year"])
+    two = df["num"] == 2
+    df.loc[two, "cite"] = (
+        df.loc[two, "au1_f"]
+        + " \\& "
+        + df.loc[two, "au2_f"]
+        + "("
+        + df.loc[two, "year"].astype(str)
+        + ")"
+    )
 
 
 def check_arxiv(df: pd.DataFrame) -> None:
@@ -446,10 +513,7 @@ def check_arxiv(df: pd.DataFrame) -> None:
     Args:
         df (pd.DataFrame): bib data
     """
-    arxiv_list = list()
-    for i in range(len(df)):
-        if "arXiv" in df.iloc[i]["key"]:
-            arxiv_list.append(df.iloc[i]["key"])
+    arxiv_list = list(df.loc[df["key"].str.contains("arXiv", regex=False), "key"])
     if len(arxiv_list) > 0:
         logger.warning(
             "{0} arXiv citations in bib: {1}".format(
@@ -528,9 +592,7 @@ def remove_doi(df: pd.DataFrame) -> None:
     Args:
         df (pd.DataFrame): bib data frame
     """
-    for i in range(len(df)):
-        item = df.iloc[i]
-        df.loc[i, "bib"] = item.bib.split(" doi:")[0]
+    df["bib"] = df["bib"].str.split(" doi:", n=1, regex=False).str[0]
 
 
 def locate_bib(content_dict: dict[str, list], main_file: Path) -> str | None:
@@ -549,29 +611,82 @@ def locate_bib(content_dict: dict[str, list], main_file: Path) -> str | None:
     return None
 
 
-def query_bib_to_file(df: pd.DataFrame, bib_file: str, is_aas: bool) -> None:
-    """Qurey bib and export file.
+def collect_keys(df: pd.DataFrame, line_list: list[str]) -> list[str]:
+    """Collect the keys in the bib data and the cited keys in the content.
 
     Args:
         df (DataFrame): bib data
+        line_list (list): line list
+
+    Returns:
+        keys (list[str]): keys
+    """
+    keys = list(df.key.values)
+    keys.extend(key for key in find_cited_keys(line_list) if key not in keys)
+    return keys
+
+
+def fetch_all_records(keys: list[str]) -> list | None:
+    """Fetch ADS records of all the keys.
+
+    Args:
+        keys (list[str]): keys
+
+    Returns:
+        records (list): list of ADS records. If there is no key, the ADS
+                        query fails or any key is not found, return None.
+    """
+    if len(keys) == 0:
+        logger.warning("No citation is found!")
+        return None
+    try:
+        records = adsapi.fetch_records(keys)
+    except Exception as e:
+        logger.error("ADS query failed: {0}".format(e))
+        return None
+    missing_keys = set(keys) - set(record["key"] for record in records)
+    for key in missing_keys:
+        logger.warning("{0} is not found in the ADS!".format(key))
+    if len(missing_keys) > 0:
+        return None
+    return records
+
+
+def query_bib_to_file(keys: list[str], bib_file: str, is_aas: bool) -> None:
+    """Qurey bib and export file.
+
+    The file is left untouched if any record cannot be fetched
+
+    Args:
+        keys (list[str]): keys
         bib_file (str): bib file path
         is_aas (bool): whether is aas format
     """
-    bib_str = adsapi.export_citation(list(df.key.values), "bibtex")
-    assert bib_str is not None
-    aas_journal_dict = read_aas_journal_dict()
+    records = fetch_all_records(keys)
+    if records is None:
+        logger.error("{0} is not overwritten!".format(bib_file))
+        return
+    journals = read_journal_dict(is_aas)
     with open(bib_file, "w") as f:
-        for line in bib_str:
-            if not is_aas and line.strip().startswith("journal"):
-                split = re.split("{|}", line)
-                if split[1] in aas_journal_dict:
-                    split[1] = aas_journal_dict[split[1]]
-                    line = split[0] + "{" + split[1] + "}" + split[2]
-                else:
-                    logger.warning(
-                        "{0} is not found in the AAS journal TeX!".format(split[1])
-                    )
-            f.write(line + "\n")
+        for record in records:
+            f.write(adsapi.render_bibtex(record, journals) + "\n\n")
+
+
+def query_json_to_file(keys: list[str], json_file: str) -> None:
+    """Query ADS records and export json file.
+
+    The file is left untouched if any record cannot be fetched
+
+    Args:
+        keys (list[str]): keys
+        json_file (str): json file path
+    """
+    records = fetch_all_records(keys)
+    if records is None:
+        logger.error("{0} is not written!".format(json_file))
+        return
+    with open(json_file, "w") as f:
+        f.write(adsapi.render_json(records) + "\n")
 
 
 def read_aas_journal_dict() -> dict:
@@ -585,6 +700,27 @@ def read_aas_journal_dict() -> dict:
     return aas_journal_dict
 
 
+def read_journal_dict(is_aas: bool = True) -> dict:
+    """Read ADS bibstem to AAS journal dictionary.
+
+    Args:
+        is_aas (bool): whether is aas format. If not, map to the journal
+                       shortname instead of the macro
+
+    Returns:
+        journals (dict): ADS bibstem to journal
+    """
+    aas_journal_dict = read_aas_journal_dict()
+    journals = {name: macro for macro, name in aas_journal_dict.items()}
+    journals.update(BIBSTEM_MACROS)
+    if not is_aas:
+        journals = {
+            bibstem: aas_journal_dict.get(macro, macro)
+            for bibstem, macro in journals.items()
+        }
+    return journals
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-f", "--filename", type=str, help="filename of main tex file")
@@ -594,11 +730,16 @@ if __name__ == "__main__":
     )
     parser.add_argument("-b", "--bib", help="use bib file", action="store_true")
     parser.add_argument("-a", "--aas", help="not in aastex env", action="store_false")
+    parser.add_argument(
+        "-j", "--json", help="export ADS records to json", action="store_true"
+    )
     args = parser.parse_args()
     filename = args.filename
 
     main_file = get_main_tex_file(filename)
     check_main_file_exist(main_file)
+    records_file = main_file.parent / RECORDS_FILE
+    adsapi.load_records(records_file)
 
     df = read_bib(main_file)
     content_dict = dict()
@@ -620,4 +761,9 @@ if __name__ == "__main__":
     else:
         bib_file = locate_bib(content_dict, main_file)
         if bib_file is not None:
-            query_bib_to_file(df, bib_file, args.aas)
+            query_bib_to_file(collect_keys(df, line_list), bib_file, args.aas)
+    if args.json:
+        query_json_to_file(
+            collect_keys(df, line_list), "{0}.json".format(main_file.stem)
+        )
+    adsapi.save_records(records_file)
@@ -0,0 +1,246 @@
+import json
+import sys
+import types
+
+import pytest
+
+import adsapi
+
+RECORD = {
+    "key": "2019ApJ...880....1S",
+    "bibcode": "2019ApJ...880....1S",
+    "authors": ["Smith, John A.", "Müller, Émile"],
+    "title": "H<SUB>2</SUB>O & 50% of stars",
+    "year": "2019",
+    "journal": "ApJ",
+    "pub": "The Astrophysical Journal",
+    "doctype": "article",
+    "volume": "880",
+    "page": "1",
+    "doi": "10.3847/1538-4357/ab0000",
+    "eprint": "",
+}
+JOURNALS = {"ApJ": "\\apj", "A\\&A": "\\aap"}
+
+
+def make_article(**fields):
+    article = dict.fromkeys(adsapi.FIELDS)
+    article.update(fields)
+    return types.SimpleNamespace(**article)
+
+
+class FakeArticles(list):
+    def __init__(self):
+        super().__init__()
+        self.queries = list()
+
+
+@pytest.fixture
+def fake_ads(monkeypatch):
+    """Replace the ads package with one answering from a list of articles.
+
+    An exception in the list is raised by the query instead. The query
+    strings are kept in the queries attribute of the list.
+    """
+    articles = FakeArticles()
+    module = types.ModuleType("ads")
+
+    class SearchQuery:
+        def __init__(self, **kwargs):
+            articles.queries.append(kwargs["q"])
+
+        def __iter__(self):
+            for article in articles:
+                if isinstance(article, Exception):
+                    raise article
+                yield article
+
+    module.SearchQuery = SearchQuery
+    monkeypatch.setitem(sys.modules, "ads", module)
+    monkeypatch.setattr(adsapi, "_records", dict())
+    return articles
+
+
+def test_to_latex():
+    assert adsapi.to_latex("H<SUB>2</SUB>O") == "H$_{2}$O"
+    assert adsapi.to_latex("10<SUP>5</SUP>") == "10$^{5}$"
+    assert adsapi.to_latex("A &amp; B, 5% #1") == "A \\& B, 5\\% \\#1"
+    assert adsapi.to_latex("A \\& B") == "A \\& B"
+    assert adsapi.to_latex("Müller") == 'M{\\"u}ller'
+    assert adsapi.to_latex("Çelik") == "{\\c{C}}elik"
+    assert adsapi.to_latex("Øster") == "{\\O}ster"
+
+
+@pytest.mark.parametrize(
+    "author, name",
+    [
+        ("Smith, John A.", ("Smith", "J.~A.")),
+        ("Smith, J.", ("Smith", "J.")),
+        ("Doe, Jean-Luc", ("Doe", "J.-L.")),
+        ("Müller, Émile", ('M{\\"u}ller', "{\\'E}.")),
+        ("Collaboration", ("Collaboration", "")),
+    ],
+)
+def test_split_name(author, name):
+    assert adsapi.split_name(author) == name
+
+
+@pytest.mark.parametrize(
+    "authors, cite",
+    [
+        ([], "Anonymous(2019)"),
+        (["Smith, J."], "Smith(2019)"),
+        (["Smith, J.", "Jones, B."], "Smith \\& Jones(2019)"),
+        (["Smith, J.", "Jones, B.", "Doe, C."], "Smith et al.(2019)"),
+    ],
+)
+def test_format_cite(authors, cite):
+    assert adsapi.format_cite(dict(RECORD, authors=authors)) == cite
+
+
+def test_format_journal():
+    assert adsapi.format_journal(RECORD) == "ApJ"
+    assert adsapi.format_journal(RECORD, JOURNALS) == "\\apj"
+    record = dict(RECORD, journal="A&A")
+    assert adsapi.format_journal(record, JOURNALS) == "\\aap"
+    record = dict(RECORD, journal="Sci", pub="Science")
+    assert adsapi.format_journal(record, JOURNALS) == "Science"
+
+
+def test_format_journal_warns_once(monkeypatch, caplog):
+    monkeypatch.setattr(adsapi, "_unmapped_journals", set())
+    record = dict(RECORD, journal="Sci", pub="Science")
+    adsapi.format_bib(record, JOURNALS)
+    adsapi.render_bibtex(record, JOURNALS)
+    warnings = [r for r in caplog.records if "is not found" in r.getMessage()]
+    assert [r.getMessage() for r in warnings] == [
+        "Sci is not found in the AAS journal TeX!"
+    ]
+
+
+def test_format_bib():
+    assert adsapi.format_bib(RECORD, JOURNALS) == (
+        'Smith, J.~A., \\& M{\\"u}ller, {\\\'E}.\\ 2019, \\apj, 880, 1. '
+        "doi:10.3847/1538-4357/ab0000"
+    )
+    record = dict(
+        RECORD,
+        authors=["A, a.", "B, b.", "C, c.", "D, d."],
+        volume="",
+        page="",
+        doi="",
+    )
+    assert adsapi.format_bib(record, JOURNALS) == (
+        "A, a., B, b., C, c., et al.\\ 2019, \\apj"
+    )
+
+
+def test_render_aastex():
+    assert adsapi.render_aastex(RECORD, JOURNALS).startswith(
+        "\\bibitem[Smith \\& M{\\\"u}ller(2019)]{2019ApJ...880....1S} Smith, J.~A."
+    )
+
+
+def test_render_bibtex():
+    entry = adsapi.render_bibtex(RECORD, JOURNALS)
+    assert entry.splitlines() == [
+        "@ARTICLE{2019ApJ...880....1S,",
+        '       author = {{Smith}, J.~A. and {M{\\"u}ller}, {\\\'E}.},',
+        '        title = "{H$_{2}$O \\& 50\\% of stars}",',
+        "      journal = {\\apj},",
+        "         year = 2019,",
+        "       volume = {880},",
+        "        pages = {1},",
+        "          doi = {10.3847/1538-4357/ab0000},",
+        "}",
+    ]
+
+
+def test_render_bibtex_doctype():
+    record = dict(
+        RECORD,
+        key="2019arXiv190101234S",
+        doctype="eprint",
+        journal="arXiv",
+        pub="arXiv e-prints",
+        eprint="1901.01234",
+    )
+    entry = adsapi.render_bibtex(record, JOURNALS)
+    assert entry.startswith("@ARTICLE{2019arXiv190101234S,")
+    assert "      journal = {arXiv e-prints}," in entry
+    assert "       eprint = {1901.01234}," in entry
+    record = dict(RECORD, doctype="inproceedings", pub="Proc. A & B")
+    entry = adsapi.render_bibtex(record, JOURNALS)
+    assert entry.startswith("@INPROCEEDINGS{")
+    assert "    booktitle = {Proc. A \\& B}," in entry
+    assert adsapi.render_bibtex(dict(RECORD, doctype="catalog")).startswith("@MISC{")
+
+
+def test_render_json():
+    assert json.loads(adsapi.render_json([RECORD])) == [RECORD]
+
+
+def test_fetch_records(fake_ads):
+    fake_ads.append(
+        make_article(
+            bibcode="2019ApJ...880....1S",
+            author=["Smith, J."],
+            year="2019",
+            bibstem=["ApJ"],
+            doctype="article",
+        )
+    )
+    records = adsapi.fetch_records(["2019ApJ...880....1S", "2019ApJ...880....2X"])
+    assert fake_ads.queries == [
+        'identifier:"2019ApJ...880....1S" OR identifier:"2019ApJ...880....2X"'
+    ]
+    assert [record["key"] for record in records] == ["2019ApJ...880....1S"]
+    assert records[0]["doi"] == ""
+    assert adsapi.fetch_records(["2019ApJ...880....1S"]) == records
+    assert len(fake_ads.queries) == 1
+
+
+def test_save_and_load_records(tmp_path, fake_ads, monkeypatch):
+    filename = tmp_path / "records.json"
+    adsapi.save_records(filename)
+    assert not filename.exists()
+    fake_ads.append(make_article(bibcode="2019ApJ...880....1S", year="2019"))
+    records = adsapi.fetch_records(["2019ApJ...880....1S"])
+    adsapi.save_records(filename)
+
+    monkeypatch.setattr(adsapi, "_records", dict())
+    adsapi.load_records(filename)
+    assert adsapi.fetch_records(["2019ApJ...880....1S"]) == records
+    assert len(fake_ads.queries) == 1
+
+
+def test_load_records_invalid(tmp_path, monkeypatch):
+    monkeypatch.setattr(adsapi, "_records", dict())
+    adsapi.load_records(tmp_path / "missing.json")
+    (tmp_path / "broken.json").write_text("{")
+    adsapi.load_records(tmp_path / "broken.json")
+    assert adsapi._records == dict()
+
+
+def test_fetch_records_alternate_bibcode(fake_ads):
+    fake_ads.append(
+        make_article(
+            bibcode="2020ApJ...900....1S",
+            alternate_bibcode=["2019arXiv190101234S"],
+            identifier=["2019arXiv190101234S", "arXiv:1901.01234"],
+            author=["Smith, J."],
+            year="2020",
+        )
+    )
+    records = adsapi.fetch_records(["2019arXiv190101234S"])
+    assert fake_ads.queries == ['identifier:"2019arXiv190101234S"']
+    assert len(records) == 1
+    assert records[0]["key"] == "2019arXiv190101234S"
+    assert records[0]["bibcode"] == "2020ApJ...900....1S"
+    assert records[0]["eprint"] == "1901.01234"
+
+
+def test_fetch_records_raises(fake_ads):
+    fake_ads.append(RuntimeError("rate limit"))
+    with pytest.raises(RuntimeError):
+        adsapi.fetch_records(["2019ApJ...880....1S"])
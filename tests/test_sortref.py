@@ -0,0 +1,194 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import adsapi
+import sortref
+
+ROOT = Path(__file__).resolve().parents[1]
+
+JOURNALS = {"ApJ": "\\apj", "MNRAS": "\\mnras"}
+AUTHORS = [
+    "Smith, John A.",
+    "Müller, Émile",
+    "Doe, Jean-Luc",
+    "Li, X.",
+    "Wu, Y.",
+]
+INFO_FIELDS = [
+    "cite",
+    "key",
+    "bib",
+    "year",
+    "num",
+    "au1_f",
+    "au1_l",
+    "au2_f",
+    "au2_l",
+    "au3_f",
+    "au3_l",
+    "au1_f_low",
+    "au1_l_low",
+    "au2_f_low",
+    "au2_l_low",
+    "au3_f_low",
+    "au3_l_low",
+]
+
+
+def make_record(n_authors, doi="10.1093/mnras/stz0000"):
+    return {
+        "key": "2019MNRAS.480....1S",
+        "bibcode": "2019MNRAS.480....1S",
+        "authors": AUTHORS[:n_authors],
+        "title": "A title",
+        "year": "2019",
+        "journal": "MNRAS",
+        "pub": "Monthly Notices of the Royal Astronomical Society",
+        "doctype": "article",
+        "volume": "480",
+        "page": "1",
+        "doi": doi,
+        "eprint": "",
+    }
+
+
+@pytest.mark.parametrize("n_authors", [1, 2, 3, 4, 5])
+@pytest.mark.parametrize("doi", ["10.1093/mnras/stz0000", ""])
+def test_record_to_info_matches_extract_info(n_authors, doi):
+    record = make_record(n_authors, doi)
+    info = sortref.record_to_info(record, JOURNALS)
+    expected = sortref.extract_info(adsapi.render_aastex(record, JOURNALS))
+    assert {field: info[field] for field in INFO_FIELDS} == {
+        field: expected[field] for field in INFO_FIELDS
+    }
+
+
+def test_record_to_info_num():
+    nums = [sortref.record_to_info(make_record(n), JOURNALS)["num"] for n in range(6)]
+    assert nums == [0, 1, 2, 3, 4, 4]
+
+
+def test_record_to_info_uses_requested_key():
+    record = dict(make_record(1), key="2019arXiv190101234S")
+    assert sortref.record_to_info(record, JOURNALS)["key"] == "2019arXiv190101234S"
+
+
+def test_record_to_info_year_of_replaced_bibcode():
+    pd = pytest.importorskip("pandas")
+    record = dict(
+        make_record(2),
+        key="2019arXiv190101234S",
+        bibcode="2020MNRAS.490....1S",
+        year="2020",
+    )
+    info = sortref.record_to_info(record, JOURNALS)
+    assert info["key"] == "2019arXiv190101234S"
+    assert info["year"] == "2020"
+    assert info["cite"] == 'Smith \\& M{\\"u}ller(2020)'
+    assert "\\ 2020, \\mnras" in info["bib"]
+    df = pd.DataFrame([info])
+    sortref.change_two_author_cite(df)
+    assert df.loc[0, "cite"] == 'Smith \\& M{\\"u}ller(2020)'
+
+
+FAKE_ADS = """
+import json
+import os
+import types
+
+
+class SearchQuery:
+    def __init__(self, **kwargs):
+        pass
+
+    def __iter__(self):
+        articles = json.loads(os.environ["FAKE_ADS"])
+        if articles is None:
+            raise RuntimeError("rate limit")
+        return iter(types.SimpleNamespace(**article) for article in articles)
+"""
+TEX = r"""\documentclass{aastex631}
+\addbibresource{refs.bib}
+\begin{document}
+\citep{2019MNRAS.480....1S, 2019MNRAS.480....2J}
+\end{document}
+"""
+
+
+def run_sortref(tmp_path, articles, *args):
+    """Run sortref.py in tmp_path with a fake ads answering articles."""
+    (tmp_path / "fake").mkdir(exist_ok=True)
+    (tmp_path / "fake" / "ads.py").write_text(FAKE_ADS)
+    (tmp_path / "ms.tex").write_text(TEX)
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(tmp_path / "fake"),
+        FAKE_ADS=json.dumps(articles),
+        pub=str(ROOT),
+    )
+    return subprocess.run(
+        [sys.executable, str(ROOT / "sortref.py"), "-f", "ms.tex", *args],
+        cwd=tmp_path,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+
+
+def make_article(bibcode, author):
+    article = dict.fromkeys(adsapi.FIELDS)
+    article.update(
+        bibcode=bibcode,
+        author=[author],
+        year=bibcode[:4],
+        bibstem=["MNRAS"],
+        doctype="article",
+    )
+    return article
+
+
+def test_bib_mode_writes_bib(tmp_path):
+    articles = [
+        make_article("2019MNRAS.480....1S", "Smith, J."),
+        make_article("2019MNRAS.480....2J", "Jones, B."),
+    ]
+    proc = run_sortref(tmp_path, articles, "-b", "-j")
+    assert proc.returncode == 0, proc.stderr
+    bib = (tmp_path / "refs.bib").read_text()
+    assert "@ARTICLE{2019MNRAS.480....1S," in bib
+    assert "@ARTICLE{2019MNRAS.480....2J," in bib
+    assert len(json.loads((tmp_path / "ms.json").read_text())) == 2
+
+
+def test_bib_mode_keeps_bib_on_failed_query(tmp_path):
+    (tmp_path / "refs.bib").write_text("precious\n")
+    proc = run_sortref(tmp_path, None, "-b", "-j")
+    assert "ADS query failed" in proc.stderr
+    assert (tmp_path / "refs.bib").read_text() == "precious\n"
+    assert not (tmp_path / "ms.json").exists()
+
+
+def test_bib_mode_keeps_bib_on_missing_record(tmp_path):
+    (tmp_path / "refs.bib").write_text("precious\n")
+    articles = [make_article("2019MNRAS.480....1S", "Smith, J.")]
+    proc = run_sortref(tmp_path, articles, "-b")
+    assert "2019MNRAS.480....2J is not found in the ADS!" in proc.stderr
+    assert (tmp_path / "refs.bib").read_text() == "precious\n"
+
+
+def test_records_are_reused_across_runs(tmp_path):
+    articles = [
+        make_article("2019MNRAS.480....1S", "Smith, J."),
+        make_article("2019MNRAS.480....2J", "Jones, B."),
+    ]
+    proc = run_sortref(tmp_path, articles, "-j")
+    assert proc.returncode == 0, proc.stderr
+    assert (tmp_path / sortref.RECORDS_FILE).exists()
+    proc = run_sortref(tmp_path, None, "-b")
+    assert "ADS query failed" not in proc.stderr
+    assert "@ARTICLE{2019MNRAS.480....2J," in (tmp_path / "refs.bib").read_text()
@@ -0,0 +1,65 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+# Stdlib modules sortref and adsapi import at startup
+STDLIB_IMPORTS = (
+    "import argparse, collections, glob, html, json, logging, os, pathlib, re, "
+    "sys, typing, unicodedata"
+)
+# Allowed import time of `sortref.py --help` on top of STDLIB_IMPORTS
+STARTUP_BUDGET_US = 25_000
+HEAVY_MODULES = {"pandas", "numpy", "ads", "requests"}
+
+
+def import_trace(*args):
+    """Run python with -X importtime and parse the trace.
+
+    Returns:
+        trace (list): list of (module name, self time in us)
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    assert proc.returncode == 0, proc.stderr
+    trace = list()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line.split(":", 1)[1].split("|")
+        trace.append((name.strip(), int(self_us)))
+    return trace
+
+
+def test_help_does_not_import_heavy_modules():
+    trace = import_trace("sortref.py", "--help")
+    loaded = {name.split(".")[0] for name, _ in trace}
+    assert loaded.isdisjoint(HEAVY_MODULES), loaded & HEAVY_MODULES
+
+
+def test_help_startup_budget():
+    baseline = sum(self_us for _, self_us in import_trace("-c", STDLIB_IMPORTS))
+    total = sum(self_us for _, self_us in import_trace("sortref.py", "--help"))
+    assert total - baseline < STARTUP_BUDGET_US, (
+        "startup imports took {0} us, {1} us over the stdlib baseline".format(
+            total, total - baseline
+        )
+    )
+
+
+def test_import_without_ads():
+    proc = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; sys.modules['ads'] = None; import adsapi, swapfig",
+        ],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    assert proc.returncode == 0, proc.stderr